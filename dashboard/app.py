@@ -1,9 +1,12 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
 import plotly.express as px
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, helpers
 from datetime import datetime
+import json
 import os
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -15,7 +18,10 @@ es = Elasticsearch(
     basic_auth=(
         os.getenv('ELASTIC_USER', 'elastic'),
         os.getenv('ELASTIC_PASSWORD', 'changeme')
-    )
+    ),
+    http_compress=True,
+    connections_per_node=25,
+    retry_on_timeout=True
 )
 
 # Page config must be the first Streamlit command
@@ -31,181 +37,504 @@ st.markdown("""
 Manage and curate your LLM pipeline outputs. Rate, tag, and prepare data for fine-tuning.
 """)
 
+# Updates queued by the rating, tag and finetune widgets until the user saves
+st.session_state.setdefault('pending_ops', [])
+
 # Debug info in sidebar
 st.sidebar.markdown("### Debug Info")
 st.sidebar.text(f"Elasticsearch: {os.getenv('ELASTIC_HOST', 'http://localhost:9200')}")
 
+# Number of most recent pipelines fetched per index, and per "Load more" click
+PIPELINE_PAGE_SIZE = 50
+
+# Seconds before a cached result expires even if the index stats show no writes
+CACHE_TTL = 600
+
+# The cached fetches below raise on failure so errors are not cached; callers report them
+
 # Function to fetch pipeline versions from Elasticsearch
-@st.cache_data(ttl=30)
-def fetch_pipelines():
-    try:
-        # Get all indices
-        indices = es.cat.indices(format='json')
-        pipeline_indices = [idx['index'] for idx in indices if not idx['index'].startswith('.')]
-        
-        pipelines = []
-        for idx in pipeline_indices:
-            # Get pipeline metadata
-            result = es.search(
-                index=idx,
-                body={
-                    'size': 0,
+@st.cache_data(ttl=CACHE_TTL)
+def fetch_pipelines(min_rating=1, show_finetuned=True, tag_query='', limit=PIPELINE_PAGE_SIZE):
+    # Get all indices
+    indices = es.cat.indices(format='json')
+    pipeline_indices = [idx['index'] for idx in indices if not idx['index'].startswith('.')]
+    
+    if not pipeline_indices:
+        return [], False
+    
+    # Filter on the server so only matching docs are aggregated
+    filters = []
+    if min_rating > 1:
+        filters.append({'range': {'rating': {'gte': min_rating}}})
+    if tag_query:
+        escaped = tag_query.replace('\\', '\\\\').replace('*', '\\*').replace('?', '\\?')
+        filters.append({
+            'wildcard': {
+                'tags.keyword': {
+                    'value': f"*{escaped}*",
+                    'case_insensitive': True
+                }
+            }
+        })
+    exclusions = []
+    if not show_finetuned:
+        exclusions.append({'term': {'finetuned': True}})
+    
+    query = {
+        'bool': {
+            'filter': filters,
+            'must_not': exclusions
+        }
+    }
+    
+    # Get pipeline counts and latest timestamps for every index in a single round-trip
+    result = es.search(
+        index=','.join(pipeline_indices),
+        body={
+            'size': 0,
+            'query': query,
+            'aggs': {
+                'by_index': {
+                    'terms': {
+                        'field': '_index',
+                        'size': len(pipeline_indices)
+                    },
                     'aggs': {
                         'unique_pipelines': {
                             'terms': {
                                 'field': 'pipelineHash.keyword',
-                                'size': 1000
+                                'size': limit,
+                                'shard_size': max(limit, 100),
+                                'min_doc_count': 1,
+                                'show_term_doc_count_error': False,
+                                'order': {'latest': 'desc'},
+                                # Skip global ordinals, which ES rebuilds after every refresh
+                                'execution_hint': 'map'
                             },
                             'aggs': {
-                                'latest_doc': {
-                                    'top_hits': {
-                                        'size': 1,
-                                        '_source': [
-                                            'pipelineName',
-                                            'pipelineHash',
-                                            'template',
-                                            'tags',
-                                            'rating',
-                                            'finetuned',
-                                            '@timestamp'
-                                        ]
-                                    }
+                                'latest': {
+                                    'max': {'field': '@timestamp'}
                                 }
                             }
                         }
                     }
                 }
-            )
-            
-            for bucket in result['aggregations']['unique_pipelines']['buckets']:
-                pipeline = bucket['latest_doc']['hits']['hits'][0]['_source']
-                pipeline['count'] = bucket['doc_count']
-                pipeline['index'] = idx
-                pipelines.append(pipeline)
-        
-        # Sort by timestamp if available, otherwise by count
-        if pipelines and '@timestamp' in pipelines[0]:
-            pipelines.sort(key=lambda x: x.get('@timestamp', ''), reverse=True)
-        else:
-            pipelines.sort(key=lambda x: x['count'], reverse=True)
+            }
+        }
+    )
+    
+    index_buckets = result['aggregations']['by_index']['buckets']
+    buckets = [
+        (bucket_index['key'], bucket)
+        for bucket_index in index_buckets
+        for bucket in bucket_index['unique_pipelines']['buckets']
+    ]
+    if not buckets:
+        return [], False
+    
+    # The limit applies per index, so there is more to load if any index was cut off
+    has_more = any(
+        bucket_index['unique_pipelines']['sum_other_doc_count'] > 0
+        for bucket_index in index_buckets
+    )
+    
+    # Get one matching doc per pipeline for its metadata using field collapsing
+    pipeline_hashes = list({bucket['key'] for _, bucket in buckets})
+    metadata = es.search(
+        index=','.join(pipeline_indices),
+        body={
+            'size': len(pipeline_hashes),
+            'query': {
+                'bool': {
+                    'filter': filters + [{'terms': {'pipelineHash.keyword': pipeline_hashes}}],
+                    'must_not': exclusions
+                }
+            },
+            'collapse': {'field': 'pipelineHash.keyword'},
+            # Collapse keeps the first hit, so take the metadata from the latest doc
+            'sort': [{'@timestamp': {'order': 'desc', 'unmapped_type': 'date'}}],
+            '_source': ['pipelineName', 'rating', 'tags']
+        }
+    )
+    sources = {
+        hit['fields']['pipelineHash.keyword'][0]: hit['_source']
+        for hit in metadata['hits']['hits']
+    }
+    
+    pipelines = []
+    for index, bucket in buckets:
+        pipeline = dict(sources.get(bucket['key'], {}))
+        pipeline['pipelineHash'] = bucket['key']
+        pipeline['count'] = bucket['doc_count']
+        pipeline['index'] = index
+        if bucket['latest'].get('value') is not None:
+            pipeline['@timestamp'] = bucket['latest']['value_as_string']
+        pipelines.append(pipeline)
+    
+    # Sort by timestamp if available, otherwise by count
+    if pipelines and '@timestamp' in pipelines[0]:
+        pipelines.sort(key=lambda x: x.get('@timestamp', ''), reverse=True)
+    else:
+        pipelines.sort(key=lambda x: x['count'], reverse=True)
+    
+    return pipelines, has_more
+
+# Star strings for each rating value
+RATING_STARS = {rating: "★" * rating for rating in range(6)}
+
+# Function to build the pipelines DataFrame once per set of filters
+@st.cache_data(ttl=CACHE_TTL)
+def get_pipelines_df(min_rating=1, show_finetuned=True, tag_query='', limit=PIPELINE_PAGE_SIZE):
+    pipelines, has_more = fetch_pipelines(min_rating, show_finetuned, tag_query, limit)
+    df = pd.DataFrame(pipelines)
+    
+    # Sort by timestamp (newest first)
+    if '@timestamp' in df.columns:
+        df['@timestamp'] = pd.to_datetime(df['@timestamp'], utc=True)
+        df = df.sort_values('@timestamp', ascending=False)
+    
+    # Precompute the expander labels once instead of per row while rendering
+    if not df.empty:
+        ratings = df['rating'] if 'rating' in df.columns else pd.Series(0, index=df.index)
+        df['rating_stars'] = ratings.fillna(0).astype(int).clip(0, 5).map(RATING_STARS)
+        tags = df['tags'] if 'tags' in df.columns else pd.Series(None, index=df.index, dtype=object)
+        df['tags_display'] = tags.apply(lambda t: ', '.join(t) if isinstance(t, list) and t else 'No tags')
         
-        return pipelines
-    except Exception as e:
-        st.error(f"Error fetching pipelines: {str(e)}")
-        return []
+        # Store columns as Arrow types so the cached frame pickles cheaply
+        df = df.convert_dtypes(dtype_backend='pyarrow')
+        if 'rating' in df.columns:
+            df['rating'] = df['rating'].astype(pd.ArrowDtype(pa.int8()))
+        if '@timestamp' in df.columns:
+            df['@timestamp'] = df['@timestamp'].astype(pd.ArrowDtype(pa.timestamp('ns', tz='UTC')))
+        if 'tags' in df.columns:
+            df['tags'] = df['tags'].astype(pd.ArrowDtype(pa.list_(pa.string())))
+    
+    return df, has_more
 
-# Function to fetch completions for a pipeline
-def fetch_completions(pipeline_hash, index):
-    try:
-        result = es.search(
-            index=index,
-            body={
-                'size': 100,
-                'query': {
-                    'term': {
-                        'pipelineHash.keyword': pipeline_hash
+# Function to fetch the analytics aggregations from Elasticsearch
+@st.cache_data(ttl=CACHE_TTL)
+def fetch_analytics():
+    result = es.search(
+        index='*,-.*',
+        body={
+            'size': 0,
+            'aggs': {
+                'ratings': {
+                    'histogram': {
+                        'field': 'rating',
+                        'interval': 1,
+                        'extended_bounds': {'min': 1, 'max': 5}
                     }
                 },
-                '_source': [
-                    'pipelineName',
-                    'pipelineHash',
-                    'input',
-                    'output',
-                    'parameters',
-                    'cost',
-                    'rating',
-                    'tags',
-                    'finetuned',
-                    '@timestamp'
-                ]
+                'tags': {
+                    'terms': {
+                        'field': 'tags.keyword',
+                        'size': 50,
+                        'execution_hint': 'map'
+                    }
+                },
+                'over_time': {
+                    'date_histogram': {
+                        'field': '@timestamp',
+                        'fixed_interval': '1d',
+                        'min_doc_count': 1
+                    },
+                    'aggs': {
+                        'by_pipeline': {
+                            'terms': {
+                                'field': 'pipelineName.keyword'
+                            }
+                        }
+                    }
+                }
             }
-        )
-        
-        completions = []
-        for hit in result['hits']['hits']:
-            completion = hit['_source']
-            completion['_id'] = hit['_id']
-            completion['index'] = index
-            completions.append(completion)
-        
-        # Sort by timestamp if available, otherwise by _id
-        if completions and '@timestamp' in completions[0]:
-            completions.sort(key=lambda x: x.get('@timestamp', ''), reverse=True)
-        else:
-            completions.sort(key=lambda x: x['_id'], reverse=True)
-        
-        return completions
-    except Exception as e:
-        st.error(f"Error fetching completions: {str(e)}")
-        return []
+        }
+    )
+    return result.get('aggregations', {})
+
+# Fields shown for each completion
+COMPLETION_FIELDS = [
+    'pipelineName',
+    'pipelineHash',
+    'input',
+    'output',
+    'parameters',
+    'cost',
+    'rating',
+    'tags',
+    'finetuned',
+    '@timestamp'
+]
+
+# Build the search body for a pipeline's completions
+def completions_query(pipeline_hash):
+    return {
+        'size': 100,
+        'query': {
+            'term': {
+                'pipelineHash.keyword': pipeline_hash
+            }
+        },
+        '_source': COMPLETION_FIELDS
+    }
+
+# Turn a search response into a sorted list of completions
+def parse_completions(result, index):
+    completions = []
+    for hit in result['hits']['hits']:
+        completion = hit['_source']
+        completion['_id'] = hit['_id']
+        completion['index'] = index
+        completions.append(completion)
+    
+    # Sort by timestamp if available, otherwise by _id
+    if completions and '@timestamp' in completions[0]:
+        completions.sort(key=lambda x: x.get('@timestamp', ''), reverse=True)
+    else:
+        completions.sort(key=lambda x: x['_id'], reverse=True)
+    
+    return completions
+
+# Function to fetch completions for several pipelines in one msearch round-trip;
+# versions holds the indexing counters of their indices and only keys the cache
+@st.cache_data(ttl=CACHE_TTL, max_entries=100)
+def fetch_completions_batch(pipeline_keys, versions=()):
+    if not pipeline_keys:
+        return {}
+    body = []
+    for pipeline_hash, index in pipeline_keys:
+        body.append({'index': index})
+        body.append(completions_query(pipeline_hash))
+    
+    result = es.msearch(body=body)
+    
+    completions = {}
+    for (pipeline_hash, index), response in zip(pipeline_keys, result['responses']):
+        # Raise rather than return a partial result so the failure isn't cached
+        if 'error' in response:
+            raise RuntimeError(f"{pipeline_hash} in {index}: {response['error']}")
+        completions[(pipeline_hash, index)] = parse_completions(response, index)
+    return completions
+
+# Function to queue an update, written to Elasticsearch by save_pending
+def queue_update(doc_id, index, **body):
+    st.session_state['pending_ops'].append({
+        '_op_type': 'update',
+        '_index': index,
+        '_id': doc_id,
+        **body
+    })
 
 # Function to add tag
 def add_tag(doc_id, tag, index):
     if not tag:
         st.error("Tag cannot be empty")
         return False
-    try:
-        result = es.update(
-            index=index,
-            id=doc_id,
-            body={
-                'script': {
-                    'source': '''
-                    if (!ctx._source.containsKey("tags")) {
-                        ctx._source.tags = [];
-                    }
-                    if (!ctx._source.tags.contains(params.tag)) {
-                        ctx._source.tags.add(params.tag);
-                    }
-                ''',
-                    'params': {'tag': tag}
-                }
+    queue_update(
+        doc_id,
+        index,
+        retry_on_conflict=3,
+        script={
+            'source': '''
+            ctx._source.tags = new ArrayList(new LinkedHashSet(ctx._source.tags ?: []));
+            if (!ctx._source.tags.contains(params.tag)) {
+                ctx._source.tags.add(params.tag);
             }
-        )
-        st.success(f"Added tag '{tag}'")
-        return True
-    except Exception as e:
-        st.error(f"Error adding tag: {str(e)}")
-        return False
+        ''',
+            'params': {'tag': tag}
+        }
+    )
+    st.success(f"Queued tag '{tag}' (unsaved)")
+    return True
 
 # Function to rate version
 def rate_completion(doc_id, rating, index):
     if not isinstance(rating, int) or rating < 1 or rating > 5:
         st.error("Rating must be between 1 and 5")
         return False
+    queue_update(doc_id, index, doc={'rating': rating})
+    st.success(f"Queued {rating} star rating (unsaved)")
+    return True
+
+# Function to mark as finetuned
+def mark_finetuned(doc_id, index):
+    queue_update(doc_id, index, doc={'finetuned': True})
+    st.success(f"Queued finetuned mark (unsaved)")
+    return True
+
+# Function to get the unsaved changes queued for a completion
+def pending_changes(doc_id):
+    changes = {'tags': []}
+    for op in st.session_state['pending_ops']:
+        if op['_id'] != doc_id:
+            continue
+        if 'doc' in op:
+            changes.update(op['doc'])
+        else:
+            changes['tags'].append(op['script']['params']['tag'])
+    return changes
+
+# Function to write all queued updates in one bulk request
+def save_pending():
+    pending_ops = st.session_state['pending_ops']
+    if not pending_ops:
+        return False
     try:
-        result = es.update(
-            index=index,
-            id=doc_id,
-            body={
-                'doc': {
-                    'rating': rating
-                }
-            }
+        saved, errors = helpers.bulk(
+            es,
+            pending_ops,
+            raise_on_error=False,
+            # Make the updates searchable before the caches below are refetched
+            refresh='wait_for'
         )
-        st.success(f"Rated completion with {rating} stars")
-        return True
+        clear_data_caches()
+        
+        # Keep failed updates queued so they can be retried
+        failed = set()
+        for error in errors:
+            item = error['update']
+            failed.add((item['_index'], item['_id']))
+            st.error(f"Error saving {item['_id']}: {item.get('error')}")
+        pending_ops[:] = [op for op in pending_ops if (op['_index'], op['_id']) in failed]
+        
+        if saved:
+            st.success(f"Saved {saved} changes")
+        return not errors
     except Exception as e:
-        st.error(f"Error rating completion: {str(e)}")
+        st.error(f"Error saving changes: {str(e)}")
         return False
 
-# Function to mark as finetuned
-def mark_finetuned(doc_id, index):
-    try:
-        result = es.update(
-            index=index,
-            id=doc_id,
-            body={
-                'doc': {
-                    'finetuned': True
-                }
-            }
+# Function to drop every cached Elasticsearch result
+def clear_data_caches():
+    fetch_pipelines.clear()
+    get_pipelines_df.clear()
+    fetch_analytics.clear()
+    fetch_completions_batch.clear()
+
+# Seconds between checks for new writes to the pipeline indices
+STALENESS_CHECK_INTERVAL = 30
+
+# Indexing counters of every non-dot index, the indices that have returned pipelines,
+# and when they were last read; shared across sessions like the caches
+@st.cache_resource
+def index_versions():
+    return {'versions': {}, 'watched': set(), 'checked_at': 0.0}
+
+# Function to read the indexing counters of every non-dot index
+def read_index_versions():
+    stats = es.indices.stats(index='*,-.*', metric='indexing')
+    return {
+        idx: (
+            idx_stats['primaries']['indexing']['index_total'],
+            idx_stats['primaries']['indexing']['delete_total']
         )
-        st.success(f"Marked as finetuned")
-        return True
+        for idx, idx_stats in stats['indices'].items()
+    }
+
+# Function to start watching the counters of indices that returned pipelines
+def watch_indices(indices):
+    index_versions()['watched'].update(indices)
+
+# Function to record the current index counters; returns True if the pipeline data may have changed
+def record_index_versions():
+    state = index_versions()
+    try:
+        versions = read_index_versions()
     except Exception as e:
-        st.error(f"Error marking as finetuned: {str(e)}")
+        st.error(f"Error checking for new pipeline data: {str(e)}")
         return False
+    previous = state['versions']
+    state['versions'] = versions
+    state['checked_at'] = time.time()
+    # A new or deleted index may be a pipeline; other indices, like the logs index, only
+    # count when they have returned pipelines
+    return versions.keys() != previous.keys() or any(
+        versions.get(idx) != previous.get(idx) for idx in state['watched']
+    )
+
+# Function to clear the caches only when a pipeline index has been created, removed or written to
+def clear_stale_caches():
+    if time.time() - index_versions()['checked_at'] < STALENESS_CHECK_INTERVAL:
+        return
+    if record_index_versions():
+        # These each search every pipeline index in one request, so they can't be cleared per index;
+        # fetch_completions_batch is keyed on the counters of its own indices instead
+        fetch_pipelines.clear()
+        get_pipelines_df.clear()
+        fetch_analytics.clear()
+
+# Record the counters before anything is fetched, so writes during a fetch are seen by the next check
+clear_stale_caches()
+
+# Function to queue a completions grid's edited cells, then reset the grid so they aren't queued again
+def queue_grid_edits(grid_name, grid_key, completions, completions_df):
+    edits = st.session_state[grid_key]['edited_rows']
+    for row, changes in edits.items():
+        completion = completions[int(row)]
+        if changes.get('rating') is not None and changes['rating'] != completions_df.at[int(row), 'rating']:
+            rate_completion(completion['_id'], int(changes['rating']), completion['index'])
+        if changes.get('new_tag'):
+            add_tag(completion['_id'], changes['new_tag'], completion['index'])
+        if changes.get('finetuned'):
+            mark_finetuned(completion['_id'], completion['index'])
+    
+    # Widget state can't be assigned, so render the grid under a fresh key instead
+    st.session_state[f"{grid_name}_version"] = st.session_state.get(f"{grid_name}_version", 0) + 1
+
+# Function to render one pipeline's completions; edits rerun only this fragment
+@st.fragment
+def render_pipeline(pipeline, completions):
+    st.subheader(f"{pipeline['pipelineName']} ({pipeline['pipelineHash'][:8]})")
+    
+    if not completions:
+        st.warning("No completions found for this pipeline")
+        return
+    
+    rows = []
+    for completion in completions:
+        pending = pending_changes(completion['_id'])
+        params = completion.get('parameters')
+        rows.append({
+            'input': completion.get('input'),
+            'output': completion.get('output'),
+            'parameters': json.dumps(params) if isinstance(params, dict) else str(params or ''),
+            'cost': completion.get('cost'),
+            '@timestamp': completion.get('@timestamp'),
+            'rating': pending.get('rating', completion.get('rating')),
+            'tags': ', '.join((completion.get('tags') or []) + pending['tags']),
+            'new_tag': '',
+            'finetuned': bool(completion.get('finetuned') or pending.get('finetuned'))
+        })
+    completions_df = pd.DataFrame(rows)
+    
+    # Confirmation messages are lost on rerun, so show what is still waiting to be saved
+    completion_ids = {completion['_id'] for completion in completions}
+    unsaved = sum(op['_id'] in completion_ids for op in st.session_state['pending_ops'])
+    if unsaved:
+        st.caption(f"{unsaved} unsaved changes, click 💾 Save all to write them")
+    
+    grid_name = f"completions_{pipeline['index']}_{pipeline['pipelineHash']}"
+    grid_key = f"{grid_name}_v{st.session_state.get(f'{grid_name}_version', 0)}"
+    st.data_editor(
+        completions_df,
+        hide_index=True,
+        disabled=['input', 'output', 'parameters', 'cost', '@timestamp', 'tags'],
+        column_config={
+            'input': "Input",
+            'output': "Output",
+            'parameters': "Parameters",
+            'cost': st.column_config.NumberColumn("Cost", format="$%.4f"),
+            '@timestamp': "Created",
+            'rating': st.column_config.NumberColumn("Rating", min_value=1, max_value=5, step=1),
+            'tags': "Tags",
+            'new_tag': st.column_config.TextColumn("Add Tag"),
+            'finetuned': st.column_config.CheckboxColumn("Finetuned")
+        },
+        key=grid_key,
+        # Queue edits in a callback, which runs the same way for fragment and full reruns
+        on_change=queue_grid_edits,
+        args=(grid_name, grid_key, completions, completions_df)
+    )
 
 # Sidebar for filters
 st.sidebar.header("Filters")
@@ -217,179 +546,139 @@ search_query = st.sidebar.text_input("Search Tags")
 tab1, tab2 = st.tabs(["Pipelines", "Analytics"])
 
 with tab1:
-    # Force refresh button
-    col1, col2 = st.columns([1, 4])
+    # Force refresh and save buttons
+    col1, col2, col3 = st.columns([1, 1, 3])
     with col1:
         if st.button("🔄 Refresh"):
-            st.cache_data.clear()
+            clear_data_caches()
+            record_index_versions()
             st.rerun()
     with col2:
-        st.markdown("Click refresh to fetch the latest pipelines")
+        if st.button(f"💾 Save all ({len(st.session_state['pending_ops'])})"):
+            if save_pending():
+                st.rerun()
+    with col3:
+        st.markdown("Click refresh to fetch the latest pipelines, or save to write your ratings and tags")
 
     # Fetch and display pipelines
-    pipelines = fetch_pipelines()
+    pipeline_limit = st.session_state.setdefault('pipeline_limit', PIPELINE_PAGE_SIZE)
+    try:
+        df, has_more = get_pipelines_df(rating_filter, show_finetuned, search_query, pipeline_limit)
+    except Exception as e:
+        st.error(f"Error fetching pipelines: {str(e)}")
+        df, has_more = pd.DataFrame(), False
+    if not df.empty:
+        watch_indices(df['index'].unique().tolist())
     
-    if not pipelines:
+    if df.empty:
         st.warning("No pipelines found")
     else:
-        # Convert to DataFrame for easier filtering
-        df = pd.DataFrame(pipelines)
+        # Display pipelines in one grid; ticking "Open" shows a pipeline's completions
+        grid = df[[c for c in ['pipelineName', 'count', 'rating_stars', 'tags_display', '@timestamp'] if c in df.columns]].copy()
+        grid.insert(1, 'hash', df['pipelineHash'].str[:8])
+        grid.insert(0, 'open', [
+            st.session_state.get(f"open_{index}_{pipeline_hash}", False)
+            for pipeline_hash, index in zip(df['pipelineHash'], df['index'])
+        ])
+        opened = st.data_editor(
+            grid,
+            hide_index=True,
+            disabled=[c for c in grid.columns if c != 'open'],
+            column_config={
+                'open': st.column_config.CheckboxColumn("Open"),
+                'pipelineName': "Pipeline",
+                'hash': "Hash",
+                'count': "Completions",
+                'rating_stars': "Rating",
+                'tags_display': "Tags",
+                '@timestamp': st.column_config.DatetimeColumn("Latest")
+            },
+            # Row edits are stored by position, so start a fresh grid whenever the rows change
+            key=f"pipeline_grid_{rating_filter}_{show_finetuned}_{search_query}_{pipeline_limit}"
+        )['open'].tolist()
+        for pipeline_hash, index, is_open in zip(df['pipelineHash'], df['index'], opened):
+            st.session_state[f"open_{index}_{pipeline_hash}"] = bool(is_open)
         
-        # Apply filters
-        if not show_finetuned:
-            df = df[~df['finetuned']]
-        if search_query:
-            df = df[df['tags'].apply(lambda x: search_query.lower() in ' '.join(x).lower() if x else False)]
-        if rating_filter > 1:
-            df = df[df['rating'] >= rating_filter]
+        # Get completions for the pipelines the user has opened, all at once
+        open_pipelines = df[opened]
+        pipeline_keys = tuple(zip(open_pipelines['pipelineHash'], open_pipelines['index']))
+        versions = index_versions()['versions']
+        try:
+            all_completions = fetch_completions_batch(
+                pipeline_keys,
+                tuple(versions.get(index) for _, index in pipeline_keys)
+            )
+        except Exception as e:
+            st.error(f"Error fetching completions: {str(e)}")
+            all_completions = {}
         
-        # Sort by timestamp (newest first)
-        if '@timestamp' in df.columns:
-            df['@timestamp'] = pd.to_datetime(df['@timestamp'])
-            df = df.sort_values('@timestamp', ascending=False)
+        for _, pipeline in open_pipelines.iterrows():
+            render_pipeline(pipeline, all_completions.get((pipeline['pipelineHash'], pipeline['index']), []))
         
-        # Display pipelines
-        for _, pipeline in df.iterrows():
-            rating = pipeline.get('rating')
-            rating_display = "★" * (int(rating) if pd.notna(rating) and rating is not None else 0)
-            tags_display = ', '.join(pipeline.get('tags', [])) if pipeline.get('tags') else 'No tags'
-            
-            with st.expander(
-                f"Pipeline: {pipeline['pipelineName']} ({pipeline['count']} completions) | "
-                f"Hash: {pipeline['pipelineHash'][:8]} | "
-                f"Rating: {rating_display} | Tags: {tags_display}"
-            ):
-                # Get completions for this pipeline
-                completions = fetch_completions(pipeline['pipelineHash'], pipeline['index'])
-                
-                if not completions:
-                    st.warning("No completions found for this pipeline")
-                else:
-                    for completion in completions:
-                        st.markdown("---")
-                        col1, col2 = st.columns([3, 1])
-                        
-                        with col1:
-                            # Input/Output
-                            if completion.get('input'):
-                                st.markdown("**Input:**")
-                                st.text(completion['input'])
-                            
-                            if completion.get('output'):
-                                st.markdown("**Output:**")
-                                st.text(completion['output'])
-                            
-                            if completion.get('parameters'):
-                                st.markdown("**Parameters:**")
-                                params = completion['parameters']
-                                if isinstance(params, dict):
-                                    for key, value in params.items():
-                                        # Create a label with the key name
-                                        st.text_input(key, value, key=f"param_{completion['_id']}_{key}", disabled=True)
-                                else:
-                                    st.text_input("Raw Parameters", str(params), disabled=True)
-                            
-                            col1, col2, col3 = st.columns(3)
-                            with col1:
-                                if completion.get('cost') is not None:
-                                    st.write(f"Cost: ${completion['cost']:.4f}")
-                            with col2:
-                                if completion.get('@timestamp'):
-                                    st.write(f"Created: {completion['@timestamp']}")
-                            with col3:
-                                if completion.get('finetuned'):
-                                    st.write("🎯 Finetuned")
-                        
-                        with col2:
-                            # Rating widget
-                            current_rating = completion.get('rating', 1)
-                            new_rating = st.select_slider(
-                                "Rate",
-                                options=[1, 2, 3, 4, 5],
-                                value=current_rating,
-                                key=f"rate_{completion['_id']}"
-                            )
-                            if new_rating != current_rating:
-                                if rate_completion(completion['_id'], new_rating, completion['index']):
-                                    st.rerun()
-                            
-                            # Tag input
-                            new_tag = st.text_input("Add Tag", key=f"tag_{completion['_id']}")
-                            if st.button("Add Tag", key=f"add_tag_{completion['_id']}"):
-                                if add_tag(completion['_id'], new_tag, completion['index']):
-                                    st.rerun()
-                            
-                            # Current tags
-                            st.subheader("Current Tags")
-                            for tag in (completion.get('tags') or []):
-                                st.text(f"• {tag}")
-                            
-                            # Finetune button
-                            if not completion.get('finetuned'):
-                                if st.button("Mark as Finetuned", key=f"finetune_{completion['_id']}"):
-                                    if mark_finetuned(completion['_id'], completion['index']):
-                                        st.rerun()
+        # Fetch the next page of pipelines
+        if has_more:
+            if st.button("Load more"):
+                st.session_state['pipeline_limit'] += PIPELINE_PAGE_SIZE
+                st.rerun()
 
 with tab2:
-    pipelines = fetch_pipelines()
-    if pipelines:
-        df = pd.DataFrame(pipelines)
-        
+    try:
+        analytics = fetch_analytics()
+    except Exception as e:
+        st.error(f"Error fetching analytics: {str(e)}")
+        analytics = {}
+    if analytics:
         col1, col2 = st.columns(2)
         
         with col1:
             # Rating distribution
-            if 'rating' in df.columns:
-                rating_data = df[df['rating'].notna()]
-                if not rating_data.empty:
-                    fig1 = px.histogram(
-                        rating_data,
-                        x="rating",
-                        title="Rating Distribution",
-                        labels={"rating": "Rating", "count": "Number of Pipelines"},
-                        nbins=5
-                    )
-                    st.plotly_chart(fig1)
-                else:
-                    st.info("No ratings yet")
+            ratings = pd.Series(
+                data=[b['doc_count'] for b in analytics['ratings']['buckets']],
+                index=[int(b['key']) for b in analytics['ratings']['buckets']]
+            )
+            if ratings.sum():
+                fig1 = px.bar(
+                    x=ratings.index,
+                    y=ratings.values,
+                    title="Rating Distribution",
+                    labels={"x": "Rating", "y": "Number of Completions"}
+                )
+                st.plotly_chart(fig1)
             else:
                 st.info("No ratings yet")
         
         with col2:
             # Tag distribution
-            if 'tags' in df.columns:
-                all_tags = [tag for tags in df['tags'] for tag in (tags or [])]
-                if all_tags:
-                    tag_counts = pd.Series(all_tags).value_counts()
-                    fig2 = px.bar(
-                        x=tag_counts.index,
-                        y=tag_counts.values,
-                        title="Tag Distribution",
-                        labels={"x": "Tag", "y": "Count"}
-                    )
-                    st.plotly_chart(fig2)
-                else:
-                    st.info("No tags yet")
+            tag_counts = pd.Series(
+                data=[b['doc_count'] for b in analytics['tags']['buckets']],
+                index=[b['key'] for b in analytics['tags']['buckets']]
+            )
+            if not tag_counts.empty:
+                fig2 = px.bar(
+                    x=tag_counts.index,
+                    y=tag_counts.values,
+                    title="Tag Distribution",
+                    labels={"x": "Tag", "y": "Count"}
+                )
+                st.plotly_chart(fig2)
             else:
                 st.info("No tags yet")
         
         # Usage timeline
-        if 'count' in df.columns:
-            if '@timestamp' in df.columns:
-                x_axis = pd.to_datetime(df['@timestamp'])
-                x_label = "Time"
-            else:
-                x_axis = range(len(df))
-                x_label = "Pipeline Index"
-            
+        usage = [
+            (day['key_as_string'], pipeline['key'], pipeline['doc_count'])
+            for day in analytics['over_time']['buckets']
+            for pipeline in day['by_pipeline']['buckets']
+        ]
+        if usage:
+            usage = pd.DataFrame(usage, columns=['day', 'pipelineName', 'count'])
             fig3 = px.scatter(
-                x=x_axis,
-                y=df['count'],
-                size=df['count'],
-                color=df['pipelineName'],
-                hover_data={'pipelineHash': df['pipelineHash']},
+                x=pd.to_datetime(usage['day']),
+                y=usage['count'],
+                size=usage['count'],
+                color=usage['pipelineName'],
                 title="Pipeline Usage",
-                labels={'x': x_label, 'y': 'Number of Completions', 'color': 'Pipeline'}
+                labels={'x': 'Time', 'y': 'Number of Completions', 'color': 'Pipeline'}
             )
             st.plotly_chart(fig3)
         else:
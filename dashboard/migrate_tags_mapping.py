@@ -0,0 +1,47 @@
+from elasticsearch import Elasticsearch
+import os
+import sys
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Initialize Elasticsearch client
+es = Elasticsearch(
+    os.getenv('ELASTIC_HOST', 'http://localhost:9200'),
+    basic_auth=(
+        os.getenv('ELASTIC_USER', 'elastic'),
+        os.getenv('ELASTIC_PASSWORD', 'changeme')
+    )
+)
+
+# Function to map tags as keyword in new indices so tag updates skip text analysis
+def install_tags_mapping(index_patterns):
+    es.indices.put_index_template(
+        name='distil-tags',
+        index_patterns=index_patterns,
+        priority=0,
+        template={
+            'mappings': {
+                'properties': {
+                    # Keep the tags.keyword sub-field so queries also match existing indices
+                    'tags': {
+                        'type': 'keyword',
+                        'fields': {
+                            'keyword': {'type': 'keyword'}
+                        }
+                    }
+                }
+            }
+        }
+    )
+
+if __name__ == '__main__':
+    # Pipeline indices are named after their pipelines, so pass patterns that match yours
+    index_patterns = sys.argv[1:] or ['*']
+    try:
+        install_tags_mapping(index_patterns)
+        print(f"Installed tags mapping template for {', '.join(index_patterns)}")
+    except Exception as e:
+        print(f"Error installing tags mapping template: {str(e)}")
+        sys.exit(1)